@@ -0,0 +1,170 @@
+"""
+basic_pitch のモデル出力（onset / frame の事後確率）からノートを取り出す処理。
+basic_pitch.note_creation.output_to_notes_polyphonic の逐次ループ部分を numba でコンパイルしたもの。
+numba が無い環境では peak_pick は None になり、basic_pitch の実装をそのまま使う。
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba は任意依存
+    njit = None
+
+
+# basic_pitch.note_creation と同じ定数（88 鍵の最上位の列番号と、列 0 の MIDI 番号）
+_MAX_FREQ_IDX = 87
+_MIDI_OFFSET = 21
+
+
+def _track_notes(frames, onset_times, onset_freqs, frame_thresh, min_note_len, energy_tol, melodia_trick):
+    """
+    onset の候補（時間の逆順）から frame のエネルギーが切れるまでを 1 ノートとして取り出し、
+    melodia_trick なら残ったエネルギーの大きい所から前後に伸ばしてノートを追加する。
+    戻り値は (開始フレーム, 終了フレーム, MIDI 番号, 振幅) の並列配列。
+    """
+    n_frames, n_freqs = frames.shape
+    remaining_energy = frames.astype(np.float64)
+
+    # ノート数の上限: onset の候補数 + しきい値を超えるセル数（melodia は 1 回ごとに 1 セル以上消す）
+    capacity = len(onset_times)
+    if melodia_trick:
+        capacity += int(np.count_nonzero(remaining_energy > frame_thresh))
+    starts = np.empty(capacity, dtype=np.int64)
+    ends = np.empty(capacity, dtype=np.int64)
+    pitches = np.empty(capacity, dtype=np.int64)
+    amplitudes = np.empty(capacity, dtype=np.float64)
+    n_notes = 0
+
+    for n in range(len(onset_times)):
+        note_start_idx = onset_times[n]
+        freq_idx = onset_freqs[n]
+        # 曲の終わりに近すぎる onset は飛ばす
+        if note_start_idx >= n_frames - 1:
+            continue
+
+        # この音高でエネルギーがしきい値を下回り続けるところを探す
+        i = note_start_idx + 1
+        k = 0  # しきい値を下回ってからのフレーム数
+        while i < n_frames - 1 and k < energy_tol:
+            if remaining_energy[i, freq_idx] < frame_thresh:
+                k += 1
+            else:
+                k = 0
+            i += 1
+        i -= k  # しきい値を超えていた最後のフレームまで戻る
+
+        # 短すぎるノートは捨てる
+        if i - note_start_idx <= min_note_len:
+            continue
+
+        total = 0.0
+        for t in range(note_start_idx, i):
+            total += frames[t, freq_idx]
+            remaining_energy[t, freq_idx] = 0
+            if freq_idx < _MAX_FREQ_IDX:
+                remaining_energy[t, freq_idx + 1] = 0
+            if freq_idx > 0:
+                remaining_energy[t, freq_idx - 1] = 0
+
+        starts[n_notes] = note_start_idx
+        ends[n_notes] = i
+        pitches[n_notes] = freq_idx + _MIDI_OFFSET
+        amplitudes[n_notes] = total / (i - note_start_idx)
+        n_notes += 1
+
+    # 全体の最大値探しを速くするため、フレームごとの最大値を持っておき、消したフレームだけ更新する
+    row_max = np.empty(n_frames, dtype=np.float64)
+    if melodia_trick:
+        for t in range(n_frames):
+            row_max[t] = remaining_energy[t].max()
+
+    while melodia_trick:
+        # 残っているエネルギーの最大のセル（同じ値なら先に現れる方 = np.argmax と同じ）
+        i_mid = 0
+        for t in range(1, n_frames):
+            if row_max[t] > row_max[i_mid]:
+                i_mid = t
+        best = row_max[i_mid]
+        if not best > frame_thresh:
+            break
+        freq_idx = 0
+        while remaining_energy[i_mid, freq_idx] != best:
+            freq_idx += 1
+        remaining_energy[i_mid, freq_idx] = 0
+
+        # 前方へ伸ばす
+        i = i_mid + 1
+        k = 0
+        while i < n_frames - 1 and k < energy_tol:
+            if remaining_energy[i, freq_idx] < frame_thresh:
+                k += 1
+            else:
+                k = 0
+            remaining_energy[i, freq_idx] = 0
+            if freq_idx < _MAX_FREQ_IDX:
+                remaining_energy[i, freq_idx + 1] = 0
+            if freq_idx > 0:
+                remaining_energy[i, freq_idx - 1] = 0
+            i += 1
+        i_last = i  # 前方で 0 にした範囲の終わり（行の最大値の更新用）
+        i_end = i - 1 - k
+
+        # 後方へ伸ばす
+        i = i_mid - 1
+        k = 0
+        while i > 0 and k < energy_tol:
+            if remaining_energy[i, freq_idx] < frame_thresh:
+                k += 1
+            else:
+                k = 0
+            remaining_energy[i, freq_idx] = 0
+            if freq_idx < _MAX_FREQ_IDX:
+                remaining_energy[i, freq_idx + 1] = 0
+            if freq_idx > 0:
+                remaining_energy[i, freq_idx - 1] = 0
+            i -= 1
+        i_start = i + 1 + k
+
+        # 前後に伸ばしたときに 0 にしたフレームの最大値を更新する
+        for t in range(max(i, 0), min(i_last, n_frames)):
+            row_max[t] = remaining_energy[t].max()
+
+        if i_end - i_start <= min_note_len:
+            continue
+
+        total = 0.0
+        for t in range(i_start, i_end):
+            total += frames[t, freq_idx]
+        starts[n_notes] = i_start
+        ends[n_notes] = i_end
+        pitches[n_notes] = freq_idx + _MIDI_OFFSET
+        amplitudes[n_notes] = total / (i_end - i_start)
+        n_notes += 1
+
+    return starts[:n_notes], ends[:n_notes], pitches[:n_notes], amplitudes[:n_notes]
+
+
+def _peak_pick(frames, onsets, onset_thresh, frame_thresh, min_note_len, energy_tol=11, melodia_trick=True):
+    """
+    frames / onsets は (T, 88)。onsets は basic_pitch の get_infered_onsets を通したものを渡す。
+    時間方向の極大（scipy.signal.argrelmax と同じ）でしきい値以上のセルを onset とし、時間の逆順に処理する。
+    """
+    is_peak = np.zeros(onsets.shape, dtype=np.bool_)
+    is_peak[1:-1] = (onsets[1:-1] > onsets[:-2]) & (onsets[1:-1] > onsets[2:])
+    onset_times, onset_freqs = np.nonzero(np.where(is_peak, onsets, 0) >= onset_thresh)
+
+    return _track_notes_jit(
+        np.ascontiguousarray(frames),
+        onset_times[::-1].copy(),
+        onset_freqs[::-1].copy(),
+        float(frame_thresh),
+        int(min_note_len),
+        int(energy_tol),
+        bool(melodia_trick),
+    )
+
+
+_track_notes_jit = njit(cache=True)(_track_notes) if njit is not None else None
+
+# 純 Python では melodia の全体走査が遅すぎるので、numba が無ければ使わない
+peak_pick = _peak_pick if _track_notes_jit is not None else None
@@ -1,72 +1,236 @@
+import asyncio
+import functools
+import operator
+import os
 import shutil
 import subprocess
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Optional
+from typing import ClassVar, Iterable, Optional, Sequence, Tuple
 
-@dataclass
+import numpy as np
+
+# フレット番号 → ASCII TAB のセル（b"-0", b"12" など。すべて 2 バイト固定長）
+_FRET_CELLS = np.array([str(f).rjust(2, "-").encode() for f in range(100)], dtype="S2")
+
+
+@functools.lru_cache(maxsize=8)
+def _which(executable: str, path: str) -> Optional[str]:
+    # PATH の走査結果を (コマンド名, PATH) ごとにキャッシュする
+    return shutil.which(executable, path=path)
+
+
+@functools.cache
+def _pyplot():
+    """
+    matplotlib.pyplot を初回だけ import して返す（import 自体が重いので、TAB の画像出力を使うまで遅らせる）。
+    """
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def _midi_to_pitch(midi: int) -> str:
+    note_names = ["c", "cis", "d", "ees", "e", "f", "fis", "g", "gis", "a", "bes", "b"]
+    name = note_names[midi % 12]
+    # LilyPondの 'c' は C3 (MIDI 48)
+    octave = (midi - 48) // 12
+    if octave > 0:
+        return name + "'" * octave
+    if octave < 0:
+        return name + "," * abs(octave)
+    return name
+
+
+# MIDI ノート番号 → LilyPond の音名。_PITCH_NAMES[midi] で引く
+_PITCH_NAMES = tuple(_midi_to_pitch(m) for m in range(128))
+
+# 1弦〜6弦の開放弦の MIDI（E標準）。TabResult の tuning の既定値
+_OPEN = (64, 59, 55, 50, 45, 40)
+
+# 弦番号 → LilyPond の弦指定（\1 〜 \6）
+_STRING_MARKS = ("",) + tuple(f"\\{s}" for s in range(1, 7))
+
+# 音価の境界（隣り合う音価の中間点）と、その区間に対応する LilyPond の音価
+_DUR_BOUNDS = (0.1875, 0.375, 0.75, 1.5, 3.0)
+_DUR_CODES = np.array(["32", "16", "8", "4", "2", "1"])
+
+
+def _quantize_durations(beats: np.ndarray) -> np.ndarray:
+    """
+    拍数の配列をそれぞれ最も近い音価（全音符〜32分音符）の LilyPond 表記にする。
+    同距離なら長い方を選ぶ。
+    """
+    return _DUR_CODES[np.searchsorted(_DUR_BOUNDS, beats, side="right")]
+
+
+class _LilyPondError(subprocess.CalledProcessError):
+    """
+    LilyPond のビルド失敗。LilyPond は原因を stderr に出すので、メッセージに含めて表示できるようにする。
+    """
+
+    def __str__(self) -> str:
+        message = super().__str__()
+        stderr = self.stderr.decode(errors="replace").strip() if isinstance(self.stderr, bytes) else self.stderr
+        return f"{message}\n{stderr}" if stderr else message
+
+
+def _init_tab_axes(ax) -> None:
+    """
+    TAB 描画用の Axes の下地（6本の弦・目盛り・タイトル）を用意する。
+    """
+    strings = [1, 2, 3, 4, 5, 6]
+
+    # 弦の線
+    ax.hlines(y=strings, xmin=0, xmax=1, linewidth=1)
+
+    ax.set_ylim(0.5, 6.5)
+    ax.set_yticks(strings)
+    ax.set_yticklabels([f"Str {s}" for s in strings])
+    ax.set_xticks([])
+    ax.invert_yaxis()
+    ax.set_title("Guitar TAB (simplified)")
+
+@dataclass(slots=True)
 class TabEvent:
     string: int   # 1〜6
     fret: int
     start: float  # 秒
     end: float    # 秒
 
-@dataclass
+_EVENT_FIELDS = ("string", "fret", "start", "end")
+_get_event_items = operator.itemgetter(*_EVENT_FIELDS)
+# TabResult の列の属性名（差し替えられたら並び順のキャッシュを捨てる）
+_COLUMN_NAMES = frozenset(("strings", "frets", "starts", "ends"))
+
+@dataclass(slots=True, init=False, eq=False)
 class TabResult:
-    events: List[TabEvent]
-    bpm: Optional[float] = None
+    """
+    TAB 生成結果。イベントは弦・フレット・開始・終了の並列配列（SoA）として保持する。
+    配列は読み取り専用（列ごと差し替えるのは可）。`events` で TabEvent のタプルとして取り出せる。
+    tuning は 1弦〜6弦の開放弦の MIDI（省略時は E 標準）で、LilyPond 出力の音高に使う。
+    """
+
+    strings: np.ndarray  # int8, 1〜6
+    frets: np.ndarray    # int8
+    starts: np.ndarray   # float64, 秒
+    ends: np.ndarray     # float64, 秒
+    bpm: Optional[float]
+    tuning: tuple
+    # (title, bpm, tuning, イベント列) → 生成済み LilyPond ソース
+    _ly_cache: dict = field(repr=False)
+    # イベントが開始時刻順に並んでいれば True（初回の書き出し時に判定。None は未判定）
+    _events_sorted: Optional[bool] = field(repr=False)
+    # 開始時刻順の並び替えインデックス（未ソートの場合のみ、初回の書き出し時に計算して使い回す）
+    # 配列は読み取り専用なので、どちらも列が差し替えられたとき（__setattr__）だけ捨てればよい
+    _sort_order: Optional[np.ndarray] = field(repr=False)
+
+    # to_matplotlib で使い回す (Figure, Axes)。close_figure() で解放する
+    _figure: ClassVar[Optional[tuple]] = None
+
+    def __init__(
+        self,
+        events: Iterable[TabEvent] = (),
+        bpm: Optional[float] = None,
+        tuning: Optional[Sequence[int]] = None,
+    ):
+        events = list(events)
+        self._set_columns(
+            [e.string for e in events],
+            [e.fret for e in events],
+            [e.start for e in events],
+            [e.end for e in events],
+            bpm,
+            tuning,
+        )
 
     @classmethod
-    def from_tab_events(cls, events: list[dict], bpm: Optional[float] = None) -> "TabResult":
-        return cls(
-            events=[
-                TabEvent(
-                    string=e["string"],
-                    fret=e["fret"],
-                    start=e["start"],
-                    end=e["end"],
-                )
-                for e in events
-            ],
-            bpm=bpm,
+    def from_tab_events(
+        cls, events: list[dict], bpm: Optional[float] = None, tuning: Optional[Sequence[int]] = None
+    ) -> "TabResult":
+        columns = list(zip(*map(_get_event_items, events))) or [(), (), (), ()]
+        return cls.from_arrays(*columns, bpm=bpm, tuning=tuning)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        strings: np.ndarray,
+        frets: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        bpm: Optional[float] = None,
+        tuning: Optional[Sequence[int]] = None,
+    ) -> "TabResult":
+        """
+        弦・フレット・開始・終了の並列配列から直接作る（イベントごとのオブジェクトを作らない）。
+        """
+        result = cls.__new__(cls)
+        result._set_columns(strings, frets, starts, ends, bpm, tuning)
+        return result
+
+    def __eq__(self, other: object) -> bool:
+        # キャッシュ類は比較せず、BPM とイベントの配列だけで比べる（dataclass の eq は配列を比較できない）
+        if not isinstance(other, TabResult):
+            return NotImplemented
+        return self.bpm == other.bpm and self.tuning == other.tuning and all(
+            np.array_equal(a, b)
+            for a, b in zip(
+                (self.strings, self.frets, self.starts, self.ends),
+                (other.strings, other.frets, other.starts, other.ends),
+            )
+        )
+
+    def __setattr__(self, name: str, value) -> None:
+        object.__setattr__(self, name, value)
+        if name in _COLUMN_NAMES:
+            object.__setattr__(self, "_events_sorted", None)
+            object.__setattr__(self, "_sort_order", None)
+
+    @property
+    def events(self) -> Tuple[TabEvent, ...]:
+        """
+        イベントを TabEvent のタプルとして返す（呼び出すたびに作られるコピーなので、変更しても TAB には反映されない）。
+        """
+        return tuple(
+            TabEvent(*row)
+            for row in zip(self.strings.tolist(), self.frets.tolist(), self.starts.tolist(), self.ends.tolist())
         )
 
+    def _set_columns(
+        self, strings, frets, starts, ends, bpm: Optional[float], tuning: Optional[Sequence[int]]
+    ) -> None:
+        self.strings = np.array(strings, dtype=np.int8)
+        self.frets = np.array(frets, dtype=np.int8)
+        self.starts = np.array(starts, dtype=np.float64)
+        self.ends = np.array(ends, dtype=np.float64)
+        for column in (self.strings, self.frets, self.starts, self.ends):
+            column.flags.writeable = False
+        self.bpm = bpm
+        self.tuning = _OPEN if tuning is None else tuple(int(p) for p in tuning)
+        self._ly_cache = {}
+
     def to_text(self) -> str:
         """
         超簡易ASCIIタブ（一旦「時間方向は雑に均等」でOKな例）
         """
-        if not self.events:
+        if not len(self.starts):
             return "(no notes)"
 
-        # 弦ごとにソートして並べる（簡易版）
-        lines = {s: [] for s in range(1, 7)}
         # 時間順に並べる
-        sorted_events = sorted(self.events, key=lambda e: e.start)
-
-        for e in sorted_events:
-            for s in range(1, 7):
-                if s == e.string:
-                    lines[s].append(str(e.fret).rjust(2, "-"))
-                else:
-                    lines[s].append("--")
-
-        # ASCIIタブ生成（上が1弦になるように）
-        result_lines = []
-        for s in sorted(lines.keys()):
-            row = "".join(lines[s])
-            result_lines.append(f"{s}|{row}")
-        return "\n".join(result_lines)
+        strings, frets, _, _ = self._sorted_columns()
+
+        # (弦, 時刻) の 2 バイト固定長セル表を "--" で埋め、音のあるセルだけ書き込む
+        grid = np.full((6, len(strings)), b"--", dtype="S2")
+        grid[strings.astype(np.intp) - 1, np.arange(len(strings))] = _FRET_CELLS[frets]
+
+        # ASCIIタブ生成（上が1弦になるように）。各行は連続メモリなのでそのまま文字列化できる
+        return "\n".join(f"{s}|{grid[s - 1].tobytes().decode()}" for s in range(1, 7))
 
     def to_json(self) -> dict:
         return {
             "events": [
-                {
-                    "string": e.string,
-                    "fret": e.fret,
-                    "start": e.start,
-                    "end": e.end,
-                }
-                for e in self.events
+                dict(zip(_EVENT_FIELDS, row))
+                for row in zip(self.strings.tolist(), self.frets.tolist(), self.starts.tolist(), self.ends.tolist())
             ],
             "bpm": self.bpm,
         }
@@ -75,49 +239,82 @@ class TabResult:
         """
         簡易TAB描画: 6本の弦にフレット番号をテキスト描画
         """
-        import matplotlib.pyplot as plt
-
-        fig, ax = plt.subplots(figsize=(10, 4))
-
-        strings = [1, 2, 3, 4, 5, 6]
-
-        # 弦の線
-        for s in strings:
-            ax.hlines(y=s, xmin=0, xmax=1, linewidth=1)
-
-        if self.events:
-            max_time = max(e.start for e in self.events) or 1.0
-        else:
-            max_time = 1.0
-
-        for e in self.events:
-            x = e.start / max_time
-            y = e.string
-            ax.text(x, y, str(e.fret), ha="center", va="center")
+        from matplotlib.collections import PathCollection
+        from matplotlib.textpath import TextPath
+        from matplotlib.transforms import Affine2D
+
+        plt = _pyplot()
+        fig, ax = self._tab_axes()
+        _init_tab_axes(ax)
+
+        max_time = (float(self.starts.max()) if len(self.starts) else 0.0) or 1.0
+        offsets = np.column_stack([self.starts / max_time, self.strings])
+
+        # フレット番号は Text を 1 つずつ置くと遅いので、番号ごとのグリフ形状（中央揃え・ポイント単位）を
+        # 1 度だけ作り、1 つの PathCollection としてまとめて描画する
+        font_size = plt.rcParams["font.size"]
+        label_paths = {}
+        for fret in np.unique(self.frets).tolist():
+            path = TextPath((0, 0), str(fret), size=font_size)
+            ext = path.get_extents()
+            label_paths[fret] = path.transformed(
+                Affine2D().translate(-(ext.x0 + ext.x1) / 2, -(ext.y0 + ext.y1) / 2)
+            )
 
-        ax.set_ylim(0.5, 6.5)
-        ax.set_yticks(strings)
-        ax.set_yticklabels([f"Str {s}" for s in strings])
-        ax.set_xticks([])
-        ax.invert_yaxis()
-        ax.set_title("Guitar TAB (simplified)")
+        labels = PathCollection(
+            [label_paths[fret] for fret in self.frets.tolist()],
+            offsets=offsets,
+            offset_transform=ax.transData,
+            facecolors=plt.rcParams["text.color"],
+            edgecolors="none",
+            zorder=3,  # Text と同じく弦の線より手前
+        )
+        # パスはポイント単位なので、保存時の dpi に追従するよう figure の dpi 変換を使う
+        labels.set_transform(Affine2D().scale(1 / 72) + fig.dpi_scale_trans)
+        ax.add_collection(labels, autolim=False)
 
-        plt.tight_layout()
+        fig.tight_layout()
 
         if save_path:
             file_suffix = Path(save_path).suffix.lower()
             # matplotlib は拡張子で自動判別するが、明示的な format 指定も許可
             fmt = file_suffix.lstrip(".") if file_suffix else None
-            plt.savefig(save_path, format=fmt)
-            plt.close(fig)
+            fig.savefig(save_path, format=fmt)
         else:
             plt.show()
 
-    def to_svg(self, save_path: str = "result.svg"):
+    @classmethod
+    def close_figure(cls) -> None:
+        """
+        `to_matplotlib` が使い回している Figure を閉じる（テストの後始末やメモリ解放用）。
+        """
+        if cls._figure is not None:
+            _pyplot().close(cls._figure[0])
+            cls._figure = None
+
+    @classmethod
+    def _tab_axes(cls):
+        """
+        描画用の (Figure, Axes) を返す。Figure の生成は重いので 1 つを使い回し、毎回 Axes をクリアする。
+        """
+        plt = _pyplot()
+        if cls._figure is None or not plt.fignum_exists(cls._figure[0].number):
+            cls._figure = plt.subplots(figsize=(10, 4))
+        fig, ax = cls._figure
+        ax.cla()
+        return fig, ax
+
+    def to_svg(self, save_path: str = "result.svg", *, use_matplotlib: bool = False):
         """
         PNG ではなく SVG 形式でTABを出力したい場合のヘルパー。
+        6本の線とフレット番号だけの図なので、通常は matplotlib を使わず SVG を直接書き出す。
+        `use_matplotlib=True` の場合は `to_matplotlib` と同じ描画で保存する。
         """
-        self.to_matplotlib(save_path=save_path)
+        if use_matplotlib:
+            self.to_matplotlib(save_path=save_path)
+            return
+
+        Path(save_path).write_text(self._render_svg_direct(), encoding="utf-8")
 
     # === LilyPond 出力 ===
 
@@ -147,17 +344,93 @@ class TabResult:
             実行する lilypond コマンド名。
         """
 
+        ly_path = self._write_lilypond_source(ly_path, title=title)
+
+        if compile_output is None:
+            return ly_path
+
+        cmd = self._lilypond_command(ly_path, compile_output, lilypond_executable)
+
+        # LilyPond の進捗ログは大量に出るので stdout は捨て、stderr はエラー時の確認用に受け取る
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            raise _LilyPondError(proc.returncode, cmd, stderr=proc.stderr)
+
+        return Path(compile_output)
+
+    async def to_lilypond_async(
+        self,
+        ly_path: str | Path = "result.ly",
+        *,
+        title: str = "Guitar TAB",
+        compile_output: Optional[str | Path] = None,
+        lilypond_executable: str = "lilypond",
+    ) -> Path:
+        """
+        `to_lilypond` の非同期版。複数の TAB を `asyncio.gather` で並行してビルドする場合に使う。
+        引数と戻り値は `to_lilypond` と同じ。
+        """
+
+        ly_path = self._write_lilypond_source(ly_path, title=title)
+
+        if compile_output is None:
+            return ly_path
+
+        cmd = self._lilypond_command(ly_path, compile_output, lilypond_executable)
+
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise _LilyPondError(proc.returncode, cmd, stderr=stderr)
+
+        return Path(compile_output)
+
+    # === 内部ヘルパー ===
+
+    def _render_svg_direct(self) -> str:
+        width, height = 1000, 300
+        left, right, top, row = 70, 970, 50, 40
+
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="14">',
+            f'<rect width="{width}" height="{height}" fill="white"/>',
+            f'<text x="{width / 2}" y="25" text-anchor="middle" font-size="16">Guitar TAB (simplified)</text>',
+        ]
+
+        # 弦の線（上が1弦）
+        for s in range(1, 7):
+            y = top + (s - 1) * row
+            parts.append(f'<line x1="{left}" y1="{y}" x2="{right}" y2="{y}" stroke="#1f77b4" stroke-width="1"/>')
+            parts.append(f'<text x="{left - 10}" y="{y}" text-anchor="end" dominant-baseline="central">Str {s}</text>')
+
+        max_time = (float(self.starts.max()) if len(self.starts) else 0.0) or 1.0
+        xs = (left + (right - left) * self.starts / max_time).tolist()
+        ys = (top + (self.strings.astype(np.int64) - 1) * row).tolist()
+
+        for x, y, fret in zip(xs, ys, self.frets.tolist()):
+            parts.append(
+                f'<text x="{x:.1f}" y="{y}" text-anchor="middle" dominant-baseline="central" '
+                f'paint-order="stroke" stroke="white" stroke-width="3">{fret}</text>'
+            )
+
+        parts.append("</svg>\n")
+        return "\n".join(parts)
+
+    def _write_lilypond_source(self, ly_path: str | Path, *, title: str) -> Path:
         ly_path = Path(ly_path)
 
-        if not self.events:
+        if not len(self.starts):
             raise ValueError("No events to export as LilyPond score.")
 
         lilypond_source = self._build_lilypond_source(title=title)
         ly_path.write_text(lilypond_source, encoding="utf-8")
+        return ly_path
 
-        if compile_output is None:
-            return ly_path
-
+    @staticmethod
+    def _lilypond_command(ly_path: Path, compile_output: str | Path, lilypond_executable: str) -> list[str]:
         compile_path = Path(compile_output)
         output_format = compile_path.suffix.lower().lstrip(".")
 
@@ -174,200 +447,148 @@ class TabResult:
 
         output_stem = str(compile_path.with_suffix(""))
 
-        if shutil.which(lilypond_executable) is None:
+        if _which(lilypond_executable, os.environ.get("PATH", os.defpath)) is None:
             raise FileNotFoundError(
                 f"LilyPond executable '{lilypond_executable}' not found in PATH; "
                 "install LilyPond or update the executable path."
             )
 
-        subprocess.run(
-            [lilypond_executable, *format_flag, "-o", output_stem, str(ly_path)],
-            check=True,
-        )
-
-        return compile_path
-
-    # === 内部ヘルパー ===
+        return [lilypond_executable, *format_flag, "-o", output_stem, str(ly_path)]
 
     def _build_lilypond_source(self, *, title: str) -> str:
-        events = sorted(self.events, key=lambda e: e.start)
+        # 同じ内容で何度も書き出す（タイトル違い・SVG/PDF 再ビルドなど）場合は前回の結果を返す
+        key = (
+            title,
+            self.bpm,
+            self.tuning,
+            self.strings.tobytes(),
+            self.frets.tobytes(),
+            self.starts.tobytes(),
+            self.ends.tobytes(),
+        )
+        cached = self._ly_cache.get(key)
+        if cached is None:
+            cached = self._ly_cache[key] = self._render_lilypond_source(title=title)
+        return cached
+
+    def _sorted_columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (strings, frets, starts, ends) を開始時刻順（同時刻は元の順）で返す。
+        """
+        if self._events_sorted is None:
+            self._events_sorted = bool(np.all(self.starts[1:] >= self.starts[:-1]))
+        if self._events_sorted:
+            return self.strings, self.frets, self.starts, self.ends
+        if self._sort_order is None:
+            self._sort_order = np.argsort(self.starts, kind="stable")
+        order = self._sort_order
+        return self.strings[order], self.frets[order], self.starts[order], self.ends[order]
+
+    def _render_lilypond_source(self, *, title: str) -> str:
+        strings, frets, starts, ends = self._sorted_columns()
         bpm = self.bpm or 120
         beats_per_second = bpm / 60
 
-        open_strings = {
-            6: 40,
-            5: 45,
-            4: 50,
-            3: 55,
-            2: 59,
-            1: 64,
-        }
-
-        duration_table = [
-            (4.0, "1"),
-            (2.0, "2"),
-            (1.0, "4"),
-            (0.5, "8"),
-            (0.25, "16"),
-            (0.125, "32"),
-        ]
-
-        def quantize_duration(beats: float) -> str:
-            beats = max(beats, 0.125)
-            return min(duration_table, key=lambda d: abs(d[0] - beats))[1]
-
-        def midi_to_pitch(midi: int) -> str:
-            note_names = ["c", "cis", "d", "ees", "e", "f", "fis", "g", "gis", "a", "bes", "b"]
-            name = note_names[midi % 12]
-            # LilyPondの 'c' は C3 (MIDI 48)
-            octave = (midi - 48) // 12
-            if octave > 0:
-                return name + "'" * octave
-            if octave < 0:
-                return name + "," * abs(octave)
-            return name
-
-        tokens: list[str] = []
         # 量子化の最小単位（1拍を何分割するか）
         # 4: 16分音符, 3: 3連符, 6: 6連符
         # ここでは 12 (3と4の公倍数) を基準に考えると計算しやすいが、
         # シンプルに「最も近いグリッド」を選ぶ方式にする。
         
-        def quantize_beats(beats: float) -> float:
+        def quantize_beats(beats: np.ndarray) -> np.ndarray:
             """
-            拍数を音楽的なグリッドに吸着させる。
+            拍数を音楽的なグリッドに吸着させる（配列でまとめて処理）。
             リズムを安定させるため、強制的に「16分音符 (0.25)」グリッドのみを使用する。
             3連符などは一旦除外。
             """
             grid = 0.25
-            return round(beats / grid) * grid
+            return np.round(beats / grid) * grid
 
         # 1. 全イベントを量子化し、開始時刻でグループ化（和音対応）
-        quantized_events = []
-        for event in events:
-            start_beats = event.start * beats_per_second
-            end_beats = event.end * beats_per_second
-            
-            q_start = quantize_beats(start_beats)
-            q_end = quantize_beats(end_beats)
-            
-            if q_end <= q_start:
-                q_end = q_start + 0.125 # 最低長
-            
-            quantized_events.append({
-                "start": q_start,
-                "end": q_end,
-                "event": event
-            })
-            
-        # 開始時刻でソート
-        quantized_events.sort(key=lambda x: x["start"])
-        
+        #    イベントは弦・フレット・開始・終了の並列配列として扱う
+        q_start = quantize_beats(starts * beats_per_second)
+        q_end = quantize_beats(ends * beats_per_second)
+        strings = strings.astype(np.int64)
+        frets = frets.astype(np.int64)
+
+        # 最低長
+        too_short = q_end <= q_start
+        q_end[too_short] = q_start[too_short] + 0.125
+
+        # イベントは開始時刻順で、量子化は単調なので q_start もすでに昇順（再ソート不要）
+
         # 隙間埋め（Legato化）
         # ロックのリフでは音を繋げて弾くことが多いので、短い隙間は埋める
-        for i in range(len(quantized_events) - 1):
-            curr = quantized_events[i]
-            next_evt = quantized_events[i+1]
-            
-            gap = next_evt["start"] - curr["end"]
-            
-            # 隙間があり、かつそれが大きすぎない（1拍未満）場合
-            if 0 < gap < 1.0:
-                # 前の音を伸ばす
-                curr["end"] = next_evt["start"]
-        
+        # 隙間があり、かつそれが大きすぎない（1拍未満）場合は前の音を伸ばす
+        gaps = q_start[1:] - q_end[:-1]
+        fill = (gaps > 0) & (gaps < 1.0)
+        q_end[:-1][fill] = q_start[1:][fill]
+
         # 同じ開始時刻のイベントをまとめる
-        grouped_events = []
-        if quantized_events:
-            current_group = [quantized_events[0]]
-            for i in range(1, len(quantized_events)):
-                prev = current_group[-1]
-                curr = quantized_events[i]
-                
-                # 開始時刻がほぼ同じなら同じグループ（和音）とみなす
-                if abs(curr["start"] - prev["start"]) < 0.01:
-                    current_group.append(curr)
-                else:
-                    grouped_events.append(current_group)
-                    current_group = [curr]
-            grouped_events.append(current_group)
+        # 開始時刻がほぼ同じなら同じグループ（和音）とみなす
+        group_starts = np.flatnonzero(np.diff(q_start) >= 0.01) + 1
+        group_bounds = np.concatenate(([0], group_starts, [len(q_start)])).tolist() if len(q_start) else [0]
+
+        # 和音全体の長さ用にグループ内で最大の終了時刻を求めておく
+        group_start_beats = q_start[group_bounds[:-1]].tolist()
+        group_end_beats = np.maximum.reduceat(q_end, group_bounds[:-1]).tolist() if len(q_end) else []
+
+        # イベントごとの「音名 + 弦指定」（c\5 など）を先に作っておく。音域外は None
+        open_pitches = np.array(self.tuning, dtype=np.int64)
+        pitches = open_pitches[strings - 1] + frets
+        # 下限は開放 6 弦（E 標準なら 40。Drop D では 38 も出す）
+        valid = (pitches >= min(40, int(open_pitches.min()))) & (pitches <= 88)
+        note_names = [
+            _PITCH_NAMES[p] if v else None for p, v in zip(pitches.tolist(), valid.tolist())
+        ]
+        string_marks = [_STRING_MARKS[s] for s in strings.tolist()]
+
+        # 音域内の音を 1 つ以上含むグループだけが音符を出し、直前の終了時刻を進める
+        n_groups = len(group_bounds) - 1
+        valid_groups = (
+            np.logical_or.reduceat(valid, group_bounds[:-1]) if n_groups else np.zeros(0, dtype=bool)
+        )
+        group_start_arr = np.asarray(group_start_beats, dtype=np.float64)
+        group_end_arr = np.asarray(group_end_beats, dtype=np.float64)
+
+        # 各グループから見た「直前の有効グループ」の終了時刻（なければ 0）
+        last_valid = np.maximum.accumulate(np.where(valid_groups, np.arange(n_groups), -1))
+        prev_idx = np.concatenate(([-1], last_valid[:-1])) if n_groups else last_valid
+        previous_end = np.where(prev_idx >= 0, group_end_arr[prev_idx], 0.0)
+
+        # 前の音との隙間（休符）と音価の記号をまとめて求める
+        # ロックのリフでは短い隙間は前段の量子化でレガート化して埋めてあるので、
+        # ここに残る 0.05 拍超の隙間は意図的なブレイクとして休符にする
+        gaps = group_start_arr - previous_end
+        rest_tokens = np.where(gaps > 0.05, np.char.add("r", _quantize_durations(gaps)), "").tolist()
+        dur_strs = _quantize_durations(group_end_arr - group_start_arr).tolist()
 
         tokens: list[str] = []
-        previous_end_beats = 0.0
-
-        for group in grouped_events:
-            # グループ内の代表時刻（すべて同じはず）
-            start_beats = group[0]["start"]
-            # 終了時刻はグループ内で最大のものを選ぶ（和音全体の長さ）
-            end_beats = max(e["end"] for e in group)
-            
-            # 前の音との隙間（休符）
-            gap = start_beats - previous_end_beats
-            
-            # ロックのリフでは、短い休符はノイズや検出漏れの可能性が高いので、
-            # 前の音を伸ばして埋めてしまう（レガート化）
-            # ただし、長すぎる休符（1拍以上など）は意図的なブレイクとして残す
-            if 0 < gap < 1.0:
-                # 前のトークン（音符）を探して、長さを修正するのは難しいので、
-                # ここでは「休符を出力しない」ことで対応するが、
-                # LilyPondは時間を厳密に管理するので、gapを埋めるための「見えない音」か
-                # あるいは前の音の長さを計算し直す必要がある。
-                
-                # 簡易的なアプローチ:
-                # gapが小さいなら、今回の音の開始位置を前にずらす（食わせる）ことはできない（順序が変わるため）
-                # なので、「休符トークンを追加しない」だけでは時間がズレてしまう。
-                
-                # 正しいアプローチ:
-                # quantized_events の時点で、前の音の end を次の音の start まで伸ばしておくべき。
-                pass
-            
-            if gap > 0.05:
-                # ここで休符を入れるかどうか判定
-                # 16分音符(0.25)以上の隙間なら休符を入れるが、
-                # 今回は「休符NG」という要望なので、極力埋めたい。
-                # しかし、ここで埋める処理をするより、前段の quantized_events 作成時に
-                # 「隙間を埋める」処理をした方が安全。
-                tokens.append(f"r{quantize_duration(gap)}")
-            
-            # 音価
-            duration = end_beats - start_beats
-            dur_str = quantize_duration(duration)
-            
-            # 音符の生成
-            # 和音かどうかで分岐
-            valid_notes = []
-            for item in group:
-                e = item["event"]
-                pitch = open_strings[e.string] + e.fret
-                if 40 <= pitch <= 88:
-                    valid_notes.append((pitch, e.string))
-            
-            if not valid_notes:
+        for g, (rest, dur_str, ok) in enumerate(zip(rest_tokens, dur_strs, valid_groups.tolist())):
+            if rest:
+                tokens.append(rest)
+            if not ok:
                 continue
-                
+
+            valid_notes = [
+                i for i in range(group_bounds[g], group_bounds[g + 1]) if note_names[i] is not None
+            ]
             if len(valid_notes) == 1:
                 # 単音
-                p, s = valid_notes[0]
-                tokens.append(f"{midi_to_pitch(p)}{dur_str}\\{s}")
+                i = valid_notes[0]
+                tokens.append(note_names[i] + dur_str + string_marks[i])
             else:
-                # 和音 < c e g >4 のような形式
-                # TAB譜では弦指定が必要: < c\5 e\4 g\3 >4
-                chord_content = " ".join([f"{midi_to_pitch(p)}\\{s}" for p, s in valid_notes])
-                tokens.append(f"<{chord_content}>{dur_str}")
-
-            previous_end_beats = end_beats
+                # 和音。TAB譜では弦指定が必要: < c\5 e\4 g\3 >4
+                chord_content = " ".join([note_names[i] + string_marks[i] for i in valid_notes])
+                tokens.append("<" + chord_content + ">" + dur_str)
 
-        token_lines: list[str] = []
-        line: list[str] = []
-        for token in tokens:
-            line.append(token)
-            if len(line) >= 8:
-                token_lines.append(" ".join(line))
-                line = []
-        if line:
-            token_lines.append(" ".join(line))
+        # 1 行 8 トークンずつ
+        music_block = "\n  ".join(" ".join(tokens[i : i + 8]) for i in range(0, len(tokens), 8))
 
-        music_block = "\n  ".join(token_lines)
+        # E 標準以外では TabStaff の開放弦も合わせる（\stringTuning は 6弦→1弦の順）
+        tab_with = ""
+        if self.tuning != _OPEN:
+            open_names = " ".join(_PITCH_NAMES[p] for p in reversed(self.tuning))
+            tab_with = f" \\with {{ stringTunings = \\stringTuning <{open_names}> }}"
 
         return (
             "\\version \"2.24.0\"\n"
@@ -379,7 +600,7 @@ class TabResult:
             "\\score {\n"
             "  <<\n"
             "    \\new Staff { \\clef \"treble\" \\music }\n"
-            "    \\new TabStaff { \\clef \"moderntab\" \\tabFullNotation \\music }\n"
+            f"    \\new TabStaff{tab_with} {{ \\clef \"moderntab\" \\tabFullNotation \\music }}\n"
             "  >>\n"
             "  \\layout { }\n"
             "  \\midi { }\n"
@@ -1,22 +1,263 @@
 import contextlib
+import functools
+import hashlib
+import io
+import logging
 import os
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Literal, Optional, List
+from typing import Iterable, Literal, Optional, List
 
 import librosa
+import numpy as np
 
+try:
+    from numba import njit
+except ImportError:  # numba は任意依存。無ければ純 Python の実装を使う
+    njit = None
+
+from ._peakpick import peak_pick
 from .tab_format import TabResult
-from .types import Note
 from .youtube import download_youtube_audio
 
+# basic_pitch / TensorFlow の冗長なログを抑えて、CLI の出力をTAB譜の結果に絞る
+# （TensorFlow の C++ 側のログは import 前の環境変数でしか止められない）
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+for _logger_name in ("basic_pitch", "tensorflow"):
+    logging.getLogger(_logger_name).setLevel(logging.ERROR)
+
+logger = logging.getLogger(__name__)
+
+
+# チューニングごとの開放弦のMIDI
+# E標準: 6弦E2=40, 5弦A2=45, 4弦D3=50, 3弦G3=55, 2弦B3=59, 1弦E4=64（Drop D は 6弦を D2=38 に下げる）
+# 列の並びは 6弦→1弦（同じコストなら太い弦を優先する）
+_TUNINGS = {
+    "E_standard": np.array([40, 45, 50, 55, 59, 64], dtype=np.int16),
+    "Drop_D": np.array([38, 45, 50, 55, 59, 64], dtype=np.int16),
+}
+_STRING_IDS = np.array([6, 5, 4, 3, 2, 1], dtype=np.int8)
+
+
+# BPM 推定に使う音声のサンプルレート（librosa のビート検出の既定値。basic_pitch の入力と同じなので同じ音声を使える）
+_BEAT_TRACK_SAMPLE_RATE = 22050
+
+# basic_pitch のノートイベントを受ける構造化配列の型
+_NOTE_DTYPE = np.dtype([("start", "f8"), ("end", "f8"), ("pitch", "i2"), ("velocity", "f8")])
+
+
+# 弾けない状態に付ける十分大きなコスト
+_INF_COST = 1 << 30
+
+# 使うフレットの上限（手の位置もこの範囲に収まる）
+_MAX_FRET = 20
+
+
+def _viterbi_fingering(frets, emit) -> np.ndarray:
+    """
+    (N, 6) のフレット行列から、曲全体で運指コストの合計が最小になる列（弦）の並びを Viterbi で選ぶ。
+    emit は各ポジション単独のコスト（弾けないポジションは _INF_COST）で、ここに手の移動コストを足していく。
+    移動コストは手の位置（直前に押さえたフレット。開放弦では変わらない）だけで決まるので、
+    状態は手の位置 0〜_MAX_FRET（0 は未確定）とし、各状態に入るときに使った列を記録する。
+    弾けるポジションが無いノートは -1（手の位置にも影響しない）。
+    """
+    n = len(frets)
+    n_hands = _MAX_FRET + 1
+    chosen = np.full(n, -1, dtype=np.int64)
+    back_hand = np.zeros((n, n_hands), dtype=np.int64)
+    back_col = np.zeros((n, n_hands), dtype=np.int64)
+    prev_row = np.full(n, -1, dtype=np.int64)
+
+    # 直前の弾けるノートまでで、手の位置ごとの最小累積コスト
+    # 初期状態は手の位置が未確定（0）なので、最初のノートの移動コストは 0 になる
+    # （21 要素だけなので、純 Python でも速いリストで持つ。numba でもそのままコンパイルできる）
+    dp = [_INF_COST] * n_hands
+    dp[0] = 0
+    next_dp = [0] * n_hands
+    last = -1
+
+    for i in range(n):
+        for h in range(n_hands):
+            next_dp[h] = _INF_COST
+        playable = False
+        # 同じコストなら太い弦（先の列）・低い手の位置からの遷移を優先する
+        for j in range(6):
+            if emit[i][j] >= _INF_COST:
+                continue
+            playable = True
+            fret = frets[i][j]
+            for h in range(n_hands):
+                if dp[h] >= _INF_COST:
+                    continue
+                # フレット移動コスト
+                # 開放弦(0)はどこからでもアクセスしやすいので移動コストを 0 とみなし、手の位置（ポジション）も変えない
+                # 手の位置が未確定（0）の場合も簡易的にコスト 0 とする
+                if fret == 0:
+                    cost = dp[h] + emit[i][j]
+                    new_hand = h
+                elif h == 0:
+                    cost = dp[h] + emit[i][j]
+                    new_hand = fret
+                else:
+                    cost = dp[h] + abs(fret - h) + emit[i][j]
+                    new_hand = fret
+                if cost < next_dp[new_hand]:
+                    next_dp[new_hand] = cost
+                    back_hand[i][new_hand] = h
+                    back_col[i][new_hand] = j
+
+        if not playable:
+            continue
+        for h in range(n_hands):
+            dp[h] = next_dp[h]
+        prev_row[i] = last
+        last = i
+
+    # 最小コストの終端から遷移元をたどる
+    state = 0
+    for h in range(n_hands):
+        if dp[h] < dp[state]:
+            state = h
+    i = last
+    while i >= 0:
+        chosen[i] = back_col[i][state]
+        state = back_hand[i][state]
+        i = prev_row[i]
+
+    return chosen
+
+
+# numba があれば同じ関数をネイティブコンパイルして使う（引数は NumPy 配列で渡す）
+_viterbi_fingering_jit = njit(cache=True)(_viterbi_fingering) if njit is not None else None
+
+
+# onnxruntime の GPU 実行プロバイダ（優先順）
+_ONNX_GPU_PROVIDERS = ("CUDAExecutionProvider", "DmlExecutionProvider")
+
+
+def _onnx_gpu_available() -> bool:
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return False
+    return bool(set(_ONNX_GPU_PROVIDERS) & set(ort.get_available_providers()))
+
+
+def _basic_pitch_model_path(device: str) -> Path:
+    """
+    推論デバイスに応じて basic_pitch の ICASSP 2022 モデルの形式を選ぶ。
+    ONNX / CoreML 版は _load_basic_pitch_model で GPU を使うように読み込む。
+    """
+    from basic_pitch import ICASSP_2022_MODEL_PATH, FilenameSuffix, build_icassp_2022_model_path
+
+    if device == "coreml":
+        return build_icassp_2022_model_path(FilenameSuffix.coreml)
+    if device == "cuda" or (device == "auto" and _onnx_gpu_available()):
+        return build_icassp_2022_model_path(FilenameSuffix.onnx)
+    return Path(ICASSP_2022_MODEL_PATH)
+
+
+def _cache_dir() -> Path:
+    """
+    音源分離の結果を残すユーザーのキャッシュディレクトリ（~/.cache/guitartab_transcriber）。
+    """
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "guitartab_transcriber"
+
+
+@functools.lru_cache(maxsize=None)
+def _load_basic_pitch_model(model_path: Path):
+    """
+    basic_pitch のモデルを読み込む。読み込みは数百 ms かかるので、モデルのパスごとに 1 度だけ行う。
+    basic_pitch の Model は ONNX / CoreML を CPU 専用で読み込むので、この 2 つは GPU も使えるように自前で作る。
+    """
+    from basic_pitch.inference import Model
+
+    if model_path.suffix == ".onnx":
+        import onnxruntime as ort
+
+        available = set(ort.get_available_providers())
+        providers = [p for p in _ONNX_GPU_PROVIDERS if p in available] + ["CPUExecutionProvider"]
+        model = Model.__new__(Model)
+        model.model_type = Model.MODEL_TYPES.ONNX
+        model.model = ort.InferenceSession(str(model_path), providers=providers)
+        return model
+
+    if model_path.suffix == ".mlpackage":
+        import coremltools as ct
+
+        model = Model.__new__(Model)
+        model.model_type = Model.MODEL_TYPES.COREML
+        model.model = ct.models.MLModel(str(model_path), compute_units=ct.ComputeUnit.ALL)
+        return model
+
+    return Model(model_path)
+
+
+def _cpu_threads() -> int:
+    """
+    Demucs（torch）に割り当てるスレッド数。分離は採譜の前に単独で走るので、使える CPU をすべて使う。
+    """
+    try:
+        n_cpus = len(os.sched_getaffinity(0))  # taskset / コンテナの CPU 制限を反映する
+    except AttributeError:  # macOS / Windows
+        n_cpus = os.cpu_count() or 1
+    return max(1, n_cpus)
+
+
+@functools.cache
+def _torch_device() -> str:
+    """
+    Demucs を動かすデバイスを選ぶ。torch の import は重いので最初の 1 回だけ調べる。
+    """
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+@functools.lru_cache(maxsize=None)
+def _load_demucs_model(name: str, device: str):
+    """
+    Demucs の学習済みモデルを読み込む。重み（約 80 MB）の読み込みは名前とデバイスごとに 1 度だけ行う。
+    """
+    from demucs.pretrained import get_model
+
+    model = get_model(name)
+    model.to(device)
+    model.eval()
+    return model
+
+
+def _file_digest(path: Path, chunk_size: int = 1 << 20) -> str:
+    """
+    ファイル内容の SHA-256（先頭 16 桁）。音源分離のキャッシュのキーに使う。
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
 
 @dataclass
 class TranscriptionConfig:
     tuning: Literal["E_standard", "Drop_D"] = "E_standard"
     sample_rate: int = 44100
-    min_pitch: int = 40
+    # 検出する最低音。None ならチューニングの最低音（開放 6 弦。E 標準なら 40、Drop D なら 38）
+    min_pitch: Optional[int] = None
     max_pitch: int = 88
+    # basic_pitch の推論デバイス。"auto" は onnxruntime で GPU が使えれば ONNX 版モデルを GPU で動かす
+    device: Literal["auto", "cpu", "cuda", "coreml"] = "auto"
+    # basic_pitch で一度に推論する窓の数（GPU では大きいほど呼び出し回数が減る。CPU なら 1 でもよい）
+    bp_batch_size: int = 16
+    # True なら分離したギター音声を debug_guitar.wav として残す
+    debug: bool = False
 
 
 class Transcriber:
@@ -29,26 +270,26 @@ class Transcriber:
         audio_path = Path(audio_path)
         
         # 音源分離（ギターパートの抽出）
-        print("Separating audio sources (this may take a while)...")
+        logger.info("Separating audio sources (this may take a while)...")
         guitar_audio_path = self._separate_audio(audio_path)
-        print(f"Using separated audio: {guitar_audio_path}")
+        logger.info("Using separated audio: %s", guitar_audio_path)
         
         # デバッグ用に分離された音声を保存
-        debug_path = Path("debug_guitar.wav")
-        import shutil
-        shutil.copy(guitar_audio_path, debug_path)
-        print(f"Saved separated guitar audio to: {debug_path.absolute()}")
+        if self.config.debug:
+            self._save_debug_audio(guitar_audio_path, Path("debug_guitar.wav"))
 
         notes, estimated_bpm = self._transcribe_to_notes(guitar_audio_path)
         
         # 指定されたBPMがあれば優先、なければ推定値を使用
         final_bpm = bpm if bpm is not None else estimated_bpm
-        print(f"Final BPM: {final_bpm}")
+        logger.info("Final BPM: %s", final_bpm)
 
         # ノイズ除去（最低限のフィルタのみ残す）
         notes = self._filter_notes(notes)
-        events = self._notes_to_guitar_positions(notes)
-        return TabResult.from_tab_events(events, bpm=final_bpm)
+        strings, frets, starts, ends = self._notes_to_guitar_positions(notes)
+        # LilyPond 出力の音高も同じチューニングで求めるよう、開放弦の MIDI を 1弦→6弦の順で渡す
+        tuning = _TUNINGS[self.config.tuning][::-1].tolist()
+        return TabResult.from_arrays(strings, frets, starts, ends, bpm=final_bpm, tuning=tuning)
 
     def transcribe_from_youtube(self, url: str, bpm: Optional[float] = None) -> TabResult:
         import tempfile
@@ -57,277 +298,450 @@ class Transcriber:
             audio_path = download_youtube_audio(url, Path(tmpdir))
             return self.transcribe(audio_path, bpm=bpm)
 
+    def transcribe_many(
+        self, urls: Iterable[str], bpm: Optional[float] = None, max_downloads: int = 4
+    ) -> List[TabResult]:
+        """
+        複数の YouTube URL をまとめて採譜する。結果は URL と同じ順に返す。
+        ダウンロードはスレッドで並列に進め、音源分離と推論は 1 つのモデルを使い回して順番に行う。
+        """
+        import tempfile
+        from concurrent.futures import ThreadPoolExecutor
+
+        urls = list(urls)
+        with tempfile.TemporaryDirectory() as tmpdir, ThreadPoolExecutor(max_workers=max_downloads) as pool:
+            # 同じ動画が含まれていても衝突しないよう、URL ごとに保存先を分ける
+            downloads = [
+                pool.submit(download_youtube_audio, url, Path(tmpdir) / str(i)) for i, url in enumerate(urls)
+            ]
+            # 最初のダウンロードを待つ間にモデルを読み込んでおく
+            _ = self._basic_pitch_model  # warm up
+            return [self.transcribe(download.result(), bpm=bpm) for download in downloads]
+
     # === 内部実装 ===
+
+    @functools.cached_property
+    def _basic_pitch_model(self):
+        """
+        この設定で使う basic_pitch のモデル。形式の判定（onnxruntime の確認など）と読み込みは最初の 1 回だけ。
+        """
+        return _load_basic_pitch_model(_basic_pitch_model_path(self.config.device))
     
     def _separate_audio(self, audio_path: Path) -> Path:
         """
         Demucsを使って音源分離を行い、ギターが含まれる 'other' トラックのパスを返す。
         """
+        import importlib.util
         import subprocess
         import shutil
-        
-        # 出力ディレクトリ
-        out_dir = audio_path.parent / "separated"
-        
+
+        # demucs が使えなければ分離しない（キャッシュのキーを求めるためのハッシュ計算もしない）
+        if importlib.util.find_spec("demucs") is None and shutil.which("demucs") is None:
+            logger.warning("'demucs' command not found. Skipping separation.")
+            return audio_path
+
+        # 出力ディレクトリ（YouTube の音声は一時ディレクトリに置かれるので、キャッシュは入力とは別の場所に残す）
+        out_dir = _cache_dir() / "separated"
+
+        # 同じ内容の音源はすでに分離済みならそれを使う
+        # ~/.cache/guitartab_transcriber/separated/htdemucs/{filename}_{hash}/other.wav
+        track_name = audio_path.stem
+        cached_dir = out_dir / "htdemucs" / f"{track_name}_{_file_digest(audio_path)}"
+        separated_path = cached_dir / "other.wav"
+        if separated_path.exists():
+            logger.info("Using cached separation: %s", separated_path)
+            return separated_path
+
+        device = "cpu" if self.config.device == "cpu" else _torch_device()
+        jobs = _cpu_threads()
+
+        # demucs パッケージがあれば同じプロセス内で分離する（起動と重みの読み込みを毎回しなくて済む）
+        try:
+            if self._separate_in_process(audio_path, separated_path, device, jobs):
+                return separated_path
+        except Exception as e:
+            # torchaudio が読めない形式や重みのダウンロード失敗なども、分離だけを諦めて採譜は続ける
+            # （CLI 版（ffmpeg でデコードする）があれば再試行し、無ければ元の音声を使う）
+            logger.warning("In-process Demucs failed: %s. Falling back to the demucs command.", e)
+
+        # demucsがインストールされているか確認
+        if shutil.which("demucs") is None:
+            logger.warning("'demucs' command not found. Skipping separation.")
+            return audio_path
+
         # demucsコマンドの実行
         # -n htdemucs: 高性能モデル
         # --two-stems=other: other（ギター含む）とそれ以外に分ける（高速化）
+        # --segment 7: 分割して推論し、ピークメモリ（VRAM）を抑える（htdemucs の上限は 7.8 秒）
         cmd = [
             "demucs",
             "-n", "htdemucs",
             "--two-stems", "other",
+            "-d", device,
+            "--segment", "7",
             "-o", str(out_dir),
             str(audio_path)
         ]
-        
-        # demucsがインストールされているか確認
-        if shutil.which("demucs") is None:
-            print("Warning: 'demucs' command not found. Skipping separation.")
-            return audio_path
+        env = None
+        if device == "cpu":
+            # CPU では複数ジョブで並列に処理する
+            # ジョブごとに OpenMP / MKL のスレッドを持つと jobs × jobs 本になるので、1 ジョブ 1 スレッドにする
+            cmd[-1:-1] = ["--jobs", str(jobs)]
+            env = {**os.environ, "OMP_NUM_THREADS": "1", "MKL_NUM_THREADS": "1"}
 
         try:
-            subprocess.run(cmd, check=True, capture_output=True)
+            subprocess.run(cmd, check=True, capture_output=True, env=env)
         except subprocess.CalledProcessError as e:
-            print(f"Demucs failed: {e.stderr.decode()}")
-            print("Skipping separation and using original audio.")
+            logger.warning("Demucs failed: %s", e.stderr.decode())
+            logger.warning("Skipping separation and using original audio.")
             return audio_path
             
-        # 生成されたファイルのパス
-        # separated/htdemucs/{filename}/other.wav
-        track_name = audio_path.stem
-        separated_path = out_dir / "htdemucs" / track_name / "other.wav"
-        
-        if separated_path.exists():
-            return separated_path
-        else:
-            print(f"Separated file not found at {separated_path}. Using original.")
+        # 生成されたファイルは separated/htdemucs/{filename}/other.wav
+        # ディレクトリ名にハッシュを付けてキャッシュとして残す
+        output_dir = out_dir / "htdemucs" / track_name
+        if not (output_dir / "other.wav").exists():
+            logger.warning("Separated file not found at %s. Using original.", output_dir / "other.wav")
             return audio_path
 
-    def _load_audio(self, audio_path: Path):
-        y, sr = librosa.load(audio_path, sr=self.config.sample_rate, mono=True)
+        shutil.rmtree(cached_dir, ignore_errors=True)
+        output_dir.rename(cached_dir)
+        return separated_path
+
+    def _separate_in_process(self, audio_path: Path, separated_path: Path, device: str, jobs: int) -> bool:
+        """
+        demucs を Python から直接呼んで 'other' トラックを separated_path に書き出す。
+        demucs / torchaudio が import できなければ False を返す（CLI 版にまかせる）。
+        """
+        try:
+            import torch
+            import torchaudio
+            from demucs.apply import apply_model
+        except ImportError:
+            return False
+
+        if device == "cpu":
+            # 分割した区間は 1 つずつ推論し、並列化は torch の演算内のスレッドにまかせる
+            torch.set_num_threads(jobs)
+        model = _load_demucs_model("htdemucs", device)
+
+        wav, sr = torchaudio.load(str(audio_path))
+        if sr != model.samplerate:
+            wav = torchaudio.functional.resample(wav, sr, model.samplerate)
+        # モデルはステレオ入力なので、モノラルは複製し、3ch 以上は先頭 2ch を使う
+        if wav.shape[0] == 1:
+            wav = wav.expand(2, -1)
+        wav = wav[: model.audio_channels]
+
+        # demucs CLI と同じく、入力を正規化してから推論し、出力を元のスケールに戻す
+        ref = wav.mean(0)
+        wav = (wav - ref.mean()) / ref.std()
+        with torch.no_grad():
+            sources = apply_model(
+                model,
+                wav[None],
+                device=device,
+                split=True,
+                segment=7,  # htdemucs の上限（7.8 秒）以内で分割してピークメモリを抑える
+                overlap=0.25,
+                num_workers=0,  # ワーカーを増やすと torch のスレッドと掛け算になる
+            )[0]
+        other = sources[model.sources.index("other")] * ref.std() + ref.mean()
+
+        # CLI と同じく 16bit PCM で書き出す（clip="rescale" 相当で、ピークが 1 を超えたら全体を縮める）
+        other = other / max(1.01 * other.abs().max().item(), 1.0)
+
+        # 書きかけのファイルをキャッシュとして拾わないよう、一時ファイルに書いてから置き換える
+        separated_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = separated_path.with_name(f".{separated_path.stem}.{os.getpid()}.tmp.wav")
+        try:
+            torchaudio.save(
+                str(tmp_path), other.cpu(), model.samplerate, encoding="PCM_S", bits_per_sample=16
+            )
+            os.replace(tmp_path, separated_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return True
+
+    def _save_debug_audio(self, audio_path: Path, debug_path: Path) -> None:
+        """
+        分離した音声をデバッグ用に残す。同じファイルシステム上ならハードリンクでコピーを省く。
+        """
+        import shutil
+
+        # 分離できなかったときは audio_path が入力そのものなので、同じファイルなら何もしない（消さない）
+        if debug_path.exists() and os.path.samefile(audio_path, debug_path):
+            return
+
+        # 一時ファイルに作ってから置き換える（途中で失敗しても既存の debug_path は残る）
+        tmp_path = debug_path.with_name(f".{debug_path.name}.{os.getpid()}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            os.link(audio_path, tmp_path)
+        except OSError:
+            shutil.copy(audio_path, tmp_path)  # 別デバイスなどでリンクできない場合
+        os.replace(tmp_path, debug_path)
+        logger.info("Saved separated guitar audio to: %s", debug_path.absolute())
+
+    def _load_audio(self, audio_path: Path, sr: int):
+        import soundfile as sf
+
+        # すでに目的のサンプルレートのモノラル音声ならリサンプル不要なので直接読む
+        try:
+            info = sf.info(str(audio_path))
+        except RuntimeError:
+            info = None  # soundfile が読めない形式（mp3 など）は librosa に任せる
+        if info is not None and info.samplerate == sr and info.channels == 1:
+            y, sr = sf.read(str(audio_path), dtype="float32")
+            return y, sr
+
+        # ビート検出まで float32 のまま扱う（float64 にすると STFT で触るメモリが倍になる）
+        y, sr = librosa.load(audio_path, sr=sr, mono=True, dtype=np.float32, res_type="soxr_hq")
         return y, sr
 
-    def _transcribe_to_notes(self, audio_path: Path) -> tuple[List[Note], float]:
+    def _predict_note_events(
+        self, audio: np.ndarray, onset_threshold: float, frame_threshold: float, minimum_note_length: float
+    ) -> np.ndarray:
+        """
+        basic_pitch.inference.predict と同じ処理で、音声（basic_pitch のサンプルレートのモノラル）からノートイベントを求める。
+        predict は窓ごとに 1 回ずつモデルを呼ぶので、ここでは窓を bp_batch_size 個ずつまとめて推論する。
+        ノートは _NOTE_DTYPE の構造化配列（時刻は秒）で返す。
+        """
+        from basic_pitch import note_creation
+        from basic_pitch.constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE, FFT_HOP
+        from basic_pitch.inference import unwrap_output, window_audio_file
+
+        model = self._basic_pitch_model
+        model_type = getattr(getattr(model, "model_type", None), "name", None)
+        # バッチ次元が可変なのは TensorFlow / ONNX 版のモデルだけ（TFLite / CoreML は 1 窓ずつ）
+        batch_size = self.config.bp_batch_size
+        if model_type not in ("TENSORFLOW", "ONNX"):
+            batch_size = 1
+
+        n_overlapping_frames = 30
+        overlap_len = n_overlapping_frames * FFT_HOP
+        hop_size = AUDIO_N_SAMPLES - overlap_len
+
+        output: dict[str, list] = {"note": [], "onset": [], "contour": []}
+        windows: list[np.ndarray] = []
+
+        def flush() -> None:
+            if model_type == "COREML":
+                # CoreML 版の predict は窓ごとに入力の確認結果を print するので（ロガーでは止められない）捨てる
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = model.predict(np.concatenate(windows))
+            else:
+                result = model.predict(np.concatenate(windows))
+            for k, v in result.items():
+                output[k].append(v)
+            windows.clear()
+
+        # get_audio_input と同じく、先頭に重なり分の半分の無音を足してから窓に切る
+        audio_original_length = len(audio)
+        audio = np.concatenate([np.zeros(overlap_len // 2, dtype=np.float32), audio])
+        for window, _ in window_audio_file(audio, hop_size):
+            windows.append(window[None])
+            if len(windows) >= batch_size:
+                flush()
+        if windows:
+            flush()
+
+        model_output = {
+            k: unwrap_output(np.concatenate(v), audio_original_length, n_overlapping_frames)
+            for k, v in output.items()
+        }
+        min_note_len = int(np.round(minimum_note_length / 1000 * (AUDIO_SAMPLE_RATE / FFT_HOP)))
+
+        if peak_pick is None:
+            _, note_events = note_creation.model_output_to_notes(
+                model_output,
+                onset_thresh=onset_threshold,
+                frame_thresh=frame_threshold,
+                min_note_len=min_note_len,
+            )
+            return np.fromiter(
+                ((start, end, pitch, velocity) for start, end, pitch, velocity, _ in note_events),
+                dtype=_NOTE_DTYPE,
+                count=len(note_events),
+            )
+
+        # numba があれば、onset / frame からノートを取り出すループをコンパイル済みの実装で回す
+        # （ピッチベンドは使わないので求めない）
+        frames = model_output["note"]
+        onsets = note_creation.get_infered_onsets(model_output["onset"], frames)
+        starts, ends, pitches, amplitudes = peak_pick(frames, onsets, onset_threshold, frame_threshold, min_note_len)
+        times_s = note_creation.model_frames_to_time(frames.shape[0])
+        note_arr = np.empty(len(starts), dtype=_NOTE_DTYPE)
+        note_arr["start"] = times_s[starts]
+        note_arr["end"] = times_s[ends]
+        note_arr["pitch"] = pitches
+        note_arr["velocity"] = amplitudes
+        return note_arr
+
+    def _transcribe_to_notes(self, audio_path: Path) -> tuple[np.ndarray, float]:
         """
         ここが「AI部分」。
         Basic Pitchなどのモデルで音声→ノート列に変換する。
+        ノート列は _NOTE_DTYPE の構造化配列（開始時刻順）で返し、Note オブジェクトは作らない。
         """
-        from basic_pitch.inference import predict
-        from basic_pitch import ICASSP_2022_MODEL_PATH
-
-        # predict returns: model_output, midi_data, note_events
-        # note_events is a list of (start, end, pitch, amplitude, pitch_bends)
-        #
-        # basic_pitch can emit verbose debug information to stdout/stderr. Redirect
-        # both streams during inference to keep CLI output focused on the tab
-        # results.
-        # basic_pitch can emit verbose debug information to stdout/stderr. Redirect
-        # both streams during inference to keep CLI output focused on the tab
-        # results.
-        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
-            devnull
-        ), contextlib.redirect_stderr(devnull):
-            _, _, note_events = predict(
-                str(audio_path),
-                model_or_model_path=ICASSP_2022_MODEL_PATH,
-                onset_threshold=0.5,       # 0.6 -> 0.5: 標準に戻す（拾い漏れ防止）
-                frame_threshold=0.3,       # 0.4 -> 0.3: 標準に戻す
-                minimum_note_length=50.0,  # 80ms -> 50ms: 速いパッセージに対応
-            )
+        from basic_pitch.constants import AUDIO_SAMPLE_RATE
+
+        # 音声のデコードは 1 回だけにして、basic_pitch の推論とビート検出で同じ配列を使う
+        y, sr = self._load_audio(audio_path, sr=AUDIO_SAMPLE_RATE)
+        note_arr = self._predict_note_events(
+            y,
+            onset_threshold=0.5,       # 0.6 -> 0.5: 標準に戻す（拾い漏れ防止）
+            frame_threshold=0.3,       # 0.4 -> 0.3: 標準に戻す
+            minimum_note_length=50.0,  # 80ms -> 50ms: 速いパッセージに対応
+        )
 
         # BPM推定 (librosa)
-        import librosa
-        y, sr = librosa.load(str(audio_path), sr=self.config.sample_rate)
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        estimated_bpm = int(round(float(tempo)))
-        print(f"Estimated BPM: {estimated_bpm}")
-
-        notes: List[Note] = []
-        for start, end, pitch, velocity, _ in note_events:
-            if pitch < self.config.min_pitch or pitch > self.config.max_pitch:
-                continue
-            notes.append(
-                Note(
-                    start=float(start),
-                    end=float(end),
-                    pitch=int(pitch),
-                    velocity=float(velocity),
-                )
-            )
-            
+        # ビート検出は 22050Hz で十分なので、それ以上では読まない（処理するサンプル数が半分になる）
+        beat_sr = min(self.config.sample_rate, _BEAT_TRACK_SAMPLE_RATE)
+        if beat_sr != sr:
+            y, sr = self._load_audio(audio_path, sr=beat_sr)
+        # オンセット強度は beat_track(y=...) の内部と同じ設定（周波数方向は中央値で集約）で求めて渡す
+        onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=512, aggregate=np.median)
+        tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=512)
+        # librosa 0.10 以降は要素 1 つの配列で返る
+        estimated_bpm = int(round(float(np.atleast_1d(tempo)[0])))
+        logger.info("Estimated BPM: %d", estimated_bpm)
+
+        # 音域外はマスクで一括除外する（min_pitch の指定が無ければチューニングの最低音 = 開放 6 弦から）
+        min_pitch = self.config.min_pitch
+        if min_pitch is None:
+            min_pitch = int(_TUNINGS[self.config.tuning].min())
+        in_range = (note_arr["pitch"] >= min_pitch) & (note_arr["pitch"] <= self.config.max_pitch)
+        note_arr = note_arr[in_range]
+
         # 時間順にソート
-        notes.sort(key=lambda n: n.start)
+        note_arr = note_arr[np.argsort(note_arr["start"], kind="stable")]
 
-        # デバッグ: 最初の10音を表示
-        print("\n--- First 10 detected notes (Sorted) ---")
-        for i, n in enumerate(notes[:10]):
-            print(f"Note {i}: Start={n.start:.3f}, Pitch={n.pitch}, Vel={n.velocity:.2f}")
-        print("-------------------------------------\n")
-            
-        return notes, float(estimated_bpm)
+        # デバッグ: 最初の10音を表示（DEBUG レベルが無効なら何もしない）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("--- First 10 detected notes (Sorted) ---")
+            for i, (start, _, pitch, velocity) in enumerate(note_arr[:10].tolist()):
+                logger.debug("Note %d: Start=%.3f, Pitch=%d, Vel=%.2f", i, start, pitch, velocity)
+
+        return note_arr, float(estimated_bpm)
 
-    def _filter_notes(self, notes: List[Note]) -> List[Note]:
+    def _filter_notes(self, notes: np.ndarray) -> np.ndarray:
         """
         AIが検出したノートからノイズを除去し、ギターらしい演奏に整理する。
         特に「倍音ノイズ」の除去に注力する。
+        notes は _NOTE_DTYPE の構造化配列で、残ったノートを同じ形式で返す。
         """
+        n = len(notes)
+        if n == 0:
+            return notes
+
+        starts = notes["start"]
+        ends = notes["end"]
+        pitches = notes["pitch"].astype(np.int64)
+        velocities = notes["velocity"]
+
         # 1. 時間順にソート
-        notes.sort(key=lambda n: n.start)
-        
+        order = np.argsort(starts, kind="stable")
+
         # 2. グループ化（同時発音）
-        groups = []
-        if not notes:
-            return []
-            
-        current_group = [notes[0]]
-        for i in range(1, len(notes)):
-            if abs(notes[i].start - current_group[0].start) < 0.05:
-                current_group.append(notes[i])
-            else:
-                groups.append(current_group)
-                current_group = [notes[i]]
-        groups.append(current_group)
-        
-        filtered_notes = []
-        
-        for group in groups:
-            if len(group) == 1:
-                filtered_notes.append(group[0])
-                continue
-                
-            # 倍音除去ロジック
-            # 低い音順にソート
-            group.sort(key=lambda n: n.pitch)
-            
-            kept_notes = []
-            # 一番低い音は（ベース音として）必ず残す
-            root = group[0]
-            kept_notes.append(root)
-            
-            for i in range(1, len(group)):
-                note = group[i]
-                is_harmonic = False
-                
-                # ルート音との比較
-                interval = note.pitch - root.pitch
-                
-                # オクターブ (12, 24) や 完全5度 (7, 19) は倍音の可能性が高い
-                # 特に音量がルートより小さい場合はノイズとみなす
-                if interval in [12, 24, 7, 19]:
-                    if note.velocity < root.velocity * 0.8: # ルートより明らかに弱い
-                        is_harmonic = True
-                
-                # 3度 (4, 16) も歪みで出やすいが、和音の構成音かもしれないので慎重に
-                # ここでは「非常に弱い」場合のみ消す
-                if interval in [4, 16]:
-                    if note.velocity < root.velocity * 0.5:
-                        is_harmonic = True
-
-                if not is_harmonic:
-                    kept_notes.append(note)
-            
-            filtered_notes.extend(kept_notes)
+        # グループ先頭の音から 0.05 秒未満に始まる音を同じグループとみなす
+        # 各音を先頭にしたときのグループの終わりを二分探索で一度に求め、先頭から飛び石で辿る
+        sorted_starts = starts[order]
+        group_ends = np.searchsorted(sorted_starts, sorted_starts + 0.05, side="left")
+        # start + 0.05 の丸めで境界が 1 つずれることがあるので、差（s - anchor >= 0.05）で合わせ直す
+        idx = np.arange(n)
+        while True:
+            ends_c = np.minimum(group_ends, n - 1)
+            grow = (group_ends < n) & (sorted_starts[ends_c] - sorted_starts < 0.05)
+            shrink = (group_ends > idx + 1) & (sorted_starts[group_ends - 1] - sorted_starts >= 0.05)
+            if not (grow.any() or shrink.any()):
+                break
+            group_ends += grow
+            group_ends -= shrink
+        group_ends = group_ends.tolist()
+        group_bounds = [0]
+        i = group_ends[0]
+        while i < n:
+            group_bounds.append(i)
+            i = group_ends[i]
+        group_sizes = np.diff(group_bounds + [n])
+        group_ids = np.repeat(np.arange(len(group_sizes)), group_sizes)
+
+        # グループ内は低い音順に並べる（先頭がルート音になる）
+        order = order[np.lexsort((pitches[order], group_ids))]
+        pitches = pitches[order]
+        velocities = velocities[order]
+
+        # 倍音除去ロジック
+        # 一番低い音は（ベース音として）必ず残し、他の音はルート音との音程と音量で判定する
+        root_pitch = pitches[group_bounds][group_ids]
+        root_velocity = velocities[group_bounds][group_ids]
+        interval = pitches - root_pitch
+
+        # オクターブ (12, 24) や 完全5度 (7, 19) は倍音の可能性が高い
+        # 特に音量がルートより明らかに小さい場合はノイズとみなす
+        is_harmonic = np.isin(interval, (12, 24, 7, 19)) & (velocities < root_velocity * 0.8)
+        # 3度 (4, 16) も歪みで出やすいが、和音の構成音かもしれないので慎重に
+        # ここでは「非常に弱い」場合のみ消す
+        is_harmonic |= np.isin(interval, (4, 16)) & (velocities < root_velocity * 0.5)
 
         # 3. 最終的なゴミ掃除
-        final_result = []
-        for n in filtered_notes:
-            duration = n.end - n.start
-            if duration < 0.05: continue
-            if n.pitch > 75 and n.velocity < 0.3: continue # 超高音ノイズ
-            final_result.append(n)
-            
-        return final_result
+        keep = ~is_harmonic
+        keep &= ~(ends[order] - starts[order] < 0.05)
+        keep &= ~((pitches > 75) & (velocities < 0.3))  # 超高音ノイズ
+
+        return notes[order[keep]]
 
-    def _notes_to_guitar_positions(self, notes: List[Note]) -> list[dict]:
+    def _notes_to_guitar_positions(
+        self, notes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
         """
         note列をギターの弦・フレットに割り当てるロジック。
-        ここはMVP用に「一番低い弦で弾けるポジションを選ぶ」だけの簡易版。
-        チューニングや運指最適化は今後拡張。
+        手の移動とハイフレットのコストの合計が曲全体で最小になるよう、Viterbi で弦を選ぶ。
+        開放弦の音高は config.tuning に従う。
+
+        戻り値は (strings, frets, starts, ends) の並列配列（TabResult.from_arrays にそのまま渡せる）。
         """
-        if not notes:
-            return []
+        if len(notes) == 0:
+            return (
+                np.empty(0, dtype=np.int8),
+                np.empty(0, dtype=np.int8),
+                np.empty(0, dtype=np.float64),
+                np.empty(0, dtype=np.float64),
+            )
 
         # リズム補正: 最初の音を 0.0秒（小節の頭）に合わせる
         # これにより、曲の開始位置によるズレを解消する
-        first_start = notes[0].start
-        print(f"Shifting all notes by -{first_start:.3f}s to align start.")
-        
-        # E標準の開放弦のMIDI: 6弦E2=40, 5弦A2=45, 4弦D3=50, 3弦G3=55, 2弦B3=59, 1弦E4=64
-        open_strings = {
-            6: 40,
-            5: 45,
-            4: 50,
-            3: 55,
-            2: 59,
-            1: 64,
-        }
-
-        tab_events: list[dict] = []
+        first_start = float(notes["start"][0])
+        logger.debug("Shifting all notes by -%.3fs to align start.", first_start)
         
-        # 運指決定のための状態変数
-        # 初期位置はローポジション（例: 5フレット付近）を想定、あるいは0
-        current_hand_pos = 0
-
-        for n in notes:
-            # 時間シフト
-            shifted_start = n.start - first_start
-            shifted_end = n.end - first_start
-            
-            if shifted_start < 0: shifted_start = 0
-            if shifted_end < 0: shifted_end = 0.1
-
-            possible_positions = []
-
-            # 1. この音が弾けるすべてのポジションを列挙
-            for s, open_pitch in open_strings.items():
-                fret = n.pitch - open_pitch
-                if 0 <= fret <= 20:  # 20フレットまで
-                    possible_positions.append({"string": s, "fret": fret})
-
-            if not possible_positions:
-                continue
-
-            # 2. 最適なポジションを選択
-            # コスト関数: 人間が弾きやすい運指を選ぶ
-            
-            def calculate_cost(pos):
-                fret = pos["fret"]
-                
-                # 1. フレット移動コスト
-                # 開放弦(0)はどこからでもアクセスしやすいので移動コストを低く（0）みなす
-                if fret == 0:
-                    fret_dist = 0
-                else:
-                    # 現在の手の位置との距離
-                    if current_hand_pos == 0:
-                        fret_dist = 0 # 簡易的にコスト0とする
-                    else:
-                        fret_dist = abs(fret - current_hand_pos)
-
-                # 2. ハイフレットペナルティ
-                # 基本的にローポジション〜ミドルポジションを優先する
-                # 12フレットを超えるとペナルティを付与
-                high_fret_penalty = 0
-                if fret > 12:
-                    high_fret_penalty = (fret - 12) * 2
-                
-                return fret_dist + high_fret_penalty
-
-            best_pos = min(possible_positions, key=calculate_cost)
-
-            # 選んだポジションを採用
-            tab_events.append(
-                {
-                    "string": best_pos["string"],
-                    "fret": best_pos["fret"],
-                    "start": shifted_start,
-                    "end": shifted_end,
-                }
-            )
-            
-            # 手の位置を更新
-            # 開放弦の場合は手の位置（ポジション）を変えない
-            if best_pos["fret"] > 0:
-                current_hand_pos = best_pos["fret"]
-
-        return tab_events
+        # 時間シフト（負にならないよう補正）
+        starts = notes["start"] - first_start
+        ends = notes["end"] - first_start
+        starts = np.maximum(starts, 0)
+        ends = np.where(ends < 0, 0.1, ends)
+
+        # この音が弾けるすべてのポジションを (N, 6) の行列で列挙
+        pitches = notes["pitch"]
+        frets = pitches[:, None] - _TUNINGS[self.config.tuning][None, :]
+        valid = (frets >= 0) & (frets <= _MAX_FRET)  # 20フレットまで
+
+        # ポジション単独のコストを一括で求める
+        # ハイフレットペナルティ: 基本的にローポジション〜ミドルポジションを優先し、12フレットを超えると付与
+        emit = np.where(valid, np.maximum(frets.astype(np.int64) - 12, 0) * 2, _INF_COST)
+
+        if _viterbi_fingering_jit is not None:
+            chosen = _viterbi_fingering_jit(frets, emit)
+        else:
+            # 純 Python ではリストの方が要素アクセスが速い
+            chosen = _viterbi_fingering(frets.tolist(), emit.tolist())
+
+        # 弾けるポジションが無い音は除外
+        playable = np.flatnonzero(chosen >= 0)
+        cols = chosen[playable]
+
+        return (
+            _STRING_IDS[cols],
+            frets[playable, cols],
+            starts[playable],
+            ends[playable],
+        )
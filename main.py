@@ -1,15 +1,17 @@
 import argparse
+import logging
 import sys
 import shutil
 
 
 def parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(description="Transcribe guitar tabs from a YouTube URL.")
+    parser = argparse.ArgumentParser(description="Transcribe guitar tabs from YouTube URLs.")
     parser.add_argument(
         "--url",
         "-u",
+        action="append",
         required=True,
-        help="YouTube video URL to transcribe",
+        help="YouTube video URL to transcribe (repeat to transcribe several videos)",
     )
     parser.add_argument(
         "--output",
@@ -23,40 +25,63 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Manually specify BPM (overrides estimation)",
     )
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="store_true",
+        help="Show debug output such as the first detected notes",
+    )
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
 
+    # 進捗はライブラリのロガー経由で表示する（--verbose で検出ノートなどのデバッグ出力も出す）
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.verbose:
+        logging.getLogger("guitartab_transcriber").setLevel(logging.DEBUG)
+
     from guitartab_transcriber import Transcriber
 
     # インスタンス生成
     t = Transcriber()
 
     # --- パターンA: YouTubeから生成 ---
-    url = args.url
-    print(f"Transcribing from YouTube: {url}")
+    urls = args.url
+    for url in urls:
+        print(f"Transcribing from YouTube: {url}")
 
     try:
-        tab = t.transcribe_from_youtube(url, bpm=args.bpm)
+        # 複数 URL はダウンロードを並列に進め、モデルを使い回してまとめて採譜する
+        if len(urls) == 1:
+            tabs = [t.transcribe_from_youtube(urls[0], bpm=args.bpm)]
+        else:
+            tabs = t.transcribe_many(urls, bpm=args.bpm)
 
-        # 結果をコンソールに表示
-        print("\n=== TAB ===")
-        print(tab.to_text())
+        lilypond_path = shutil.which("lilypond")
+        for i, tab in enumerate(tabs, start=1):
+            # 複数 URL のときは出力ファイル名に番号を付ける
+            suffix = "" if len(tabs) == 1 else f"_{i}"
 
-        # LilyPond 記法（.ly）を書き出し（ここまでがライブラリの責務）
-        ly_file = tab.to_lilypond("result.ly", title="Sample TAB")
-        print(f"Exported LilyPond source to {ly_file}")
+            # 結果をコンソールに表示
+            print("\n=== TAB ===" if len(tabs) == 1 else f"\n=== TAB {i}: {urls[i - 1]} ===")
+            print(tab.to_text())
 
-        lilypond_path = shutil.which("lilypond")
-        if lilypond_path:
-            svg_file = tab.to_lilypond(
-                "result.ly", title="Sample TAB", compile_output="score.svg", lilypond_executable=lilypond_path
-            )
-            print(f"Generated engraved SVG via LilyPond: {svg_file}")
-        else:
-            print("LilyPond is not installed; skipped SVG generation. Install LilyPond to produce score.svg.")
+            # LilyPond 記法（.ly）を書き出し（ここまでがライブラリの責務）
+            ly_file = tab.to_lilypond(f"result{suffix}.ly", title="Sample TAB")
+            print(f"Exported LilyPond source to {ly_file}")
+
+            if lilypond_path:
+                svg_file = tab.to_lilypond(
+                    f"result{suffix}.ly",
+                    title="Sample TAB",
+                    compile_output=f"score{suffix}.svg",
+                    lilypond_executable=lilypond_path,
+                )
+                print(f"Generated engraved SVG via LilyPond: {svg_file}")
+            else:
+                print("LilyPond is not installed; skipped SVG generation. Install LilyPond to produce score.svg.")
 
     except Exception as e:
         print(f"Error occurred: {e}")
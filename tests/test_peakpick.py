@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from guitartab_transcriber._peakpick import peak_pick
+
+note_creation = pytest.importorskip("basic_pitch.note_creation")
+
+pytestmark = pytest.mark.skipif(peak_pick is None, reason="numba is not installed")
+
+
+def _model_output(seed: int) -> tuple[np.ndarray, np.ndarray]:
+    # basic_pitch の出力に似せた (フレーム数, 88) の note / onset。ところどころに持続する音を入れる
+    rng = np.random.default_rng(seed)
+    n_frames = int(rng.integers(5, 400))
+    frames = rng.random((n_frames, 88)).astype(np.float32) ** 6
+    for _ in range(int(rng.integers(0, 30))):
+        t0, f, length = int(rng.integers(0, n_frames)), int(rng.integers(0, 88)), int(rng.integers(1, 60))
+        frames[t0 : t0 + length, f] = rng.random() * 0.6 + 0.4
+    onsets = rng.random((n_frames, 88)).astype(np.float32) ** 4
+    return frames, onsets
+
+
+@pytest.mark.parametrize("melodia_trick", [True, False])
+@pytest.mark.parametrize("seed", range(10))
+def test_peak_pick_matches_basic_pitch(seed, melodia_trick):
+    frames, onsets = _model_output(seed)
+
+    # basic_pitch 側は frames を書き換えるのでコピーを渡す
+    expected = note_creation.output_to_notes_polyphonic(
+        frames.copy(), onsets.copy(), 0.5, 0.3, 4, True, None, None, melodia_trick=melodia_trick
+    )
+    inferred = note_creation.get_infered_onsets(onsets.copy(), frames.copy())
+    starts, ends, pitches, amplitudes = peak_pick(frames, inferred, 0.5, 0.3, 4, melodia_trick=melodia_trick)
+
+    assert list(zip(starts.tolist(), ends.tolist(), pitches.tolist())) == [
+        (int(s), int(e), int(p)) for s, e, p, _ in expected
+    ]
+    # 振幅は float32 の平均なので、足し合わせる順序の違いで 1 ulp ほどずれることがある
+    np.testing.assert_allclose(amplitudes, [a for *_, a in expected], rtol=1e-6, atol=1e-7)
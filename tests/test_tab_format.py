@@ -0,0 +1,38 @@
+from guitartab_transcriber import TabEvent, TabResult
+
+_DROP_D = (64, 59, 55, 50, 45, 38)
+
+_EVENTS = (
+    TabEvent(6, 0, 0.0, 0.5),
+    TabEvent(6, 3, 0.5, 1.0),
+    TabEvent(4, 2, 1.0, 1.5),
+)
+
+
+def _score(tab_staff: str) -> str:
+    return (
+        "\\score {\n"
+        "  <<\n"
+        "    \\new Staff { \\clef \"treble\" \\music }\n"
+        f"    {tab_staff} {{ \\clef \"moderntab\" \\tabFullNotation \\music }}\n"
+        "  >>\n"
+    )
+
+
+def test_lilypond_drop_d(tmp_path):
+    tab = TabResult(_EVENTS, bpm=120, tuning=_DROP_D)
+    ly = tab._write_lilypond_source(tmp_path / "drop_d.ly", title="Drop D").read_text(encoding="utf-8")
+
+    # 6弦開放は D2、3フレットは F2。TabStaff の開放弦も Drop D になる
+    assert "  d,4\\6 f,4\\6 e4\\4\n" in ly
+    assert _score("\\new TabStaff \\with { stringTunings = \\stringTuning <d, a, d g b e'> }") in ly
+
+
+def test_lilypond_standard_tuning(tmp_path):
+    tab = TabResult(_EVENTS, bpm=120)
+    ly = tab._write_lilypond_source(tmp_path / "standard.ly", title="E").read_text(encoding="utf-8")
+
+    # E 標準では TabStaff の既定の開放弦をそのまま使う
+    assert "  e,4\\6 g,4\\6 e4\\4\n" in ly
+    assert _score("\\new TabStaff") in ly
+    assert "stringTunings" not in ly